@@ -14,6 +14,14 @@ from __future__ import annotations
 
 import numpy as np
 import pandas as pd
+from numba import njit, prange
+
+# Fixed category vocabularies – shared with the model preprocessor so
+# encoders never have to learn them from data.
+OFFENSIVE_ZONES = ["ATTACK", "DEFEND"]
+ENTRY_TYPES = ["CONTROLLED", "NEUTRAL", "OTHER"]
+# category order doubles as the integer code: SH=0, EV=1, PP=2, OTHER=3
+MANPOWER_SITUATIONS = ["SH", "EV", "PP", "OTHER"]
 
 
 # ------------------------------------------------------------------ #
@@ -24,100 +32,275 @@ def _alias_coords(df: pd.DataFrame) -> pd.DataFrame:
     Ensure numeric columns `x` / `y` exist **once**.
 
     If the dashboard (or any prior step) already inserted `x`/`y`,
-    skip renaming to avoid duplicate column labels.
+    skip renaming to avoid duplicate column labels.  Renames in place.
     """
-    df = df.copy()
-
     if "x" not in df.columns:                               # <-- new guard
         if {"arenaAdjustedXCord", "arenaAdjustedYCord"}.issubset(df.columns):
-            df = df.rename(
+            df.rename(
                 columns={
                     "arenaAdjustedXCord": "x",
                     "arenaAdjustedYCord": "y",
-                }
+                },
+                inplace=True,
             )
         else:
-            df = df.rename(
-                columns={"xCordAdjusted": "x", "yCordAdjusted": "y"}
+            df.rename(
+                columns={"xCordAdjusted": "x", "yCordAdjusted": "y"},
+                inplace=True,
             )
 
     return df
 
 def _add_is_home(df: pd.DataFrame) -> pd.DataFrame:
-    """`team` is 'HOME' / 'AWAY'.  Convert to 1 / 0 integer flag."""
-    df = df.copy()
-    df["isHomeTeam"] = (df["team"] == "HOME").astype(int)
+    """
+    `team` is 'HOME' / 'AWAY'.  Store a boolean flag; later steps read it
+    back with `.to_numpy()` (a view, no re-comparison).
+    """
+    df["isHomeTeam"] = df["team"].to_numpy() == "HOME"
     return df
 
 
 # ------------------------------------------------------------------ #
-# 1.  Zone & entry-type
+# 1.  Kernels – the only place the feature rules are written down
 # ------------------------------------------------------------------ #
-def add_zone_and_entry_type(df: pd.DataFrame) -> pd.DataFrame:
-    df = _alias_coords(df).pipe(_add_is_home)
+# Scalar rules; codes follow the category lists at the top of the module.
+@njit(cache=True)
+def _zone_code(x, home):
+    """OFFENSIVE_ZONES: ATTACK=0, DEFEND=1."""
+    attack = x > 0 if home else x < 0
+    return 0 if attack else 1
+
+
+@njit(cache=True)
+def _entry_code(loc_code, neu_lut, rush):
+    """ENTRY_TYPES: CONTROLLED=0, NEUTRAL=1, OTHER=2 (NEUTRAL wins)."""
+    if loc_code >= 0 and neu_lut[loc_code]:
+        return 1
+    if rush == 1:
+        return 0
+    return 2
+
+
+@njit(cache=True)
+def _manpower_code(home_sk, away_sk, home):
+    """MANPOWER_SITUATIONS: SH=0, EV=1, PP=2, OTHER=3 (NaN → OTHER)."""
+    d = home_sk - away_sk if home else away_sk - home_sk
+    if d == -1:
+        return 0
+    if d == 0:
+        return 1
+    if d == 1:
+        return 2
+    return 3
+
+
+@njit(cache=True)
+def _xgd_event(xgoal, home):
+    """+xGoal if shooter is home, else −xGoal."""
+    return xgoal if home else -xgoal
+
+
+# One array kernel per rule – used by the individual steps (2-4).
+@njit(cache=True, parallel=True)
+def _zone_codes(x, is_home):
+    out = np.empty(x.shape[0], dtype=np.int8)
+    for i in prange(x.shape[0]):
+        out[i] = _zone_code(x[i], is_home[i])
+    return out
+
+
+@njit(cache=True, parallel=True)
+def _entry_codes(loc_codes, neu_lut, rush):
+    out = np.empty(loc_codes.shape[0], dtype=np.int8)
+    for i in prange(loc_codes.shape[0]):
+        out[i] = _entry_code(loc_codes[i], neu_lut, rush[i])
+    return out
+
+
+@njit(cache=True, parallel=True)
+def _manpower_codes(home_sk, away_sk, is_home):
+    out = np.empty(home_sk.shape[0], dtype=np.int8)
+    for i in prange(home_sk.shape[0]):
+        out[i] = _manpower_code(home_sk[i], away_sk[i], is_home[i])
+    return out
+
+
+@njit(cache=True, parallel=True)
+def _xgd_events(xgoal, is_home):
+    out = np.empty(xgoal.shape[0], dtype=np.float64)
+    for i in prange(xgoal.shape[0]):
+        out[i] = _xgd_event(xgoal[i], is_home[i])
+    return out
+
+
+# All four rules in one sweep – used by build_feature_frame.
+@njit(cache=True, parallel=True)
+def _featurize(
+    x, is_home, rush, loc_codes, neu_lut, home_sk, away_sk, xgoal,
+    zone_out, entry_out, mp_out, xgd_out,
+):
+    """Row-wise features in one `prange` sweep over the SoA arrays."""
+    for i in prange(x.shape[0]):
+        home = is_home[i]
+        zone_out[i] = _zone_code(x[i], home)
+        entry_out[i] = _entry_code(loc_codes[i], neu_lut, rush[i])
+        mp_out[i] = _manpower_code(home_sk[i], away_sk[i], home)
+        xgd_out[i] = _xgd_event(xgoal[i], home)
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def _rolling_sum_grouped(x, starts, ends, window, out):
+    """
+    Trailing `window`-event sum of `x`, restarted at every group.
+
+    Rows must already be contiguous per group; group g spans
+    `starts[g]:ends[g]`.  One add + one subtract per row (running sum).
+    NaN is skipped on both sides, like pandas' rolling(min_periods=1):
+    a window with no valid value yields NaN.
+    """
+    for g in prange(starts.shape[0]):
+        start = starts[g]
+        s = 0.0
+        nobs = 0
+        for i in range(start, ends[g]):
+            v = x[i]
+            if not np.isnan(v):
+                s += v
+                nobs += 1
+            if i - window >= start:
+                old = x[i - window]
+                if not np.isnan(old):
+                    s -= old
+                    nobs -= 1
+            if nobs == 0:
+                s = 0.0                     # drop accumulated round-off
+                out[i] = np.nan
+            else:
+                out[i] = s
+
 
-    # offensive / defensive zone
-    attack_mask = (
-        ((df["isHomeTeam"] == 1) & (df["x"] > 0))
-        | ((df["isHomeTeam"] == 0) & (df["x"] < 0))
+def _location_codes(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """`location` category codes plus a per-category "Neu*" lookup table."""
+    # match "Neu*" once per location category, not per row
+    loc = df["location"].astype("category")
+    neu_lut = np.array(
+        [str(c).startswith("Neu") for c in loc.cat.categories], dtype=np.bool_
     )
-    df["offensive_zone"] = np.where(attack_mask, "ATTACK", "DEFEND")
-    df["offensive_zone"] = df["offensive_zone"].astype("category")
+    return loc.cat.codes.to_numpy(), neu_lut
 
-    # entry-type heuristic
-    df["entry_type"] = "OTHER"
-    df.loc[df["shotRush"] == 1, "entry_type"] = "CONTROLLED"
-    df.loc[df["location"].str.startswith("Neu"), "entry_type"] = "NEUTRAL"
-    df["entry_type"] = df["entry_type"].astype("category")
 
+def _sort_by_game_time(df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Return `df` re-ordered by (game, time) – a new frame – together with
+    the matching int64 game codes.  One stable `np.lexsort` on the integer
+    codes and the raw (float) time: fractional times keep their order and
+    NaN times sort last within their game.  A missing `game_id` has code -1.
+    """
+    games = df["game_id"].astype("category")
+    codes = games.cat.codes.to_numpy().astype(np.int64)
+    order = np.lexsort((df["time"].to_numpy(), codes))
+
+    df = df.take(order)
+    df["game_id"] = games.array.take(order)
+    return df, codes[order]
+
+
+def _rolling_by_game(codes: np.ndarray, x: np.ndarray, window: int) -> np.ndarray:
+    """
+    Per-game trailing sum of `x`; rows must be sorted by game code.
+    Rows without a game (code -1) are not a group and get NaN.
+    """
+    # rows are contiguous per game → a group starts where the code changes
+    starts = np.r_[0, np.flatnonzero(np.diff(codes)) + 1]
+    ends = np.r_[starts[1:], len(codes)]
+
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    out = np.empty_like(x)
+    _rolling_sum_grouped(x, starts, ends, window, out)
+    out[codes < 0] = np.nan
+    return out
+
+
+# ------------------------------------------------------------------ #
+# 2.  Zone & entry-type
+# ------------------------------------------------------------------ #
+def add_zone_and_entry_type(df: pd.DataFrame) -> pd.DataFrame:
+    df = _alias_coords(df).pipe(_add_is_home)
+    is_home = df["isHomeTeam"].to_numpy()
+
+    zone = _zone_codes(df["x"].to_numpy(), is_home)
+    loc_codes, neu_lut = _location_codes(df)
+    entry = _entry_codes(loc_codes, neu_lut, df["shotRush"].to_numpy())
+
+    df["offensive_zone"] = pd.Categorical.from_codes(zone, categories=OFFENSIVE_ZONES)
+    df["entry_type"] = pd.Categorical.from_codes(entry, categories=ENTRY_TYPES)
     return df
 
 
 # ------------------------------------------------------------------ #
-# 2.  Man-power situation
+# 3.  Man-power situation
 # ------------------------------------------------------------------ #
 def add_manpower_situation(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-
-    shooters = np.where(
-        df["isHomeTeam"] == 1, df["homeSkatersOnIce"], df["awaySkatersOnIce"]
+    mp = _manpower_codes(
+        df["homeSkatersOnIce"].to_numpy(),
+        df["awaySkatersOnIce"].to_numpy(),
+        df["isHomeTeam"].to_numpy(),
     )
-    defenders = np.where(
-        df["isHomeTeam"] == 1, df["awaySkatersOnIce"], df["homeSkatersOnIce"]
+    df["manpower_situation"] = pd.Categorical.from_codes(
+        mp, categories=MANPOWER_SITUATIONS
     )
-
-    diff = shooters - defenders
-    mp = pd.Series(diff, index=df.index).map({0: "EV", 1: "PP", -1: "SH"})
-    df["manpower_situation"] = mp.fillna("OTHER").astype("category")
     return df
 
 
 # ------------------------------------------------------------------ #
-# 3.  xGD (event & rolling)
+# 4.  xGD (event & rolling)
 # ------------------------------------------------------------------ #
 def add_xgd(df: pd.DataFrame, window: int = 25) -> pd.DataFrame:
-    df = df.copy()
+    df["xGD_event"] = _xgd_events(df["xGoal"].to_numpy(), df["isHomeTeam"].to_numpy())
 
-    # +xGoal if shooter is home, else −xGoal
-    df["xGD_event"] = np.where(df["isHomeTeam"] == 1, df["xGoal"], -df["xGoal"])
-    df.sort_values(["game_id", "time"], inplace=True)
-
-    df["xGD_shift"] = (
-        df.groupby("game_id")["xGD_event"]
-        .rolling(window, min_periods=1)
-        .sum()
-        .reset_index(level=0, drop=True)
-    )
+    df, codes = _sort_by_game_time(df)
+    df["xGD_shift"] = _rolling_by_game(codes, df["xGD_event"].to_numpy(), window)
     return df
 
 
 # ------------------------------------------------------------------ #
-# 4.  Orchestrator
+# 5.  Orchestrator
 # ------------------------------------------------------------------ #
-def build_feature_frame(raw: pd.DataFrame) -> pd.DataFrame:
-    """Full feature pipeline."""
-    return (
-        raw.pipe(add_zone_and_entry_type)
-        .pipe(add_manpower_situation)
-        .pipe(add_xgd)
+def build_feature_frame(raw: pd.DataFrame, window: int = 25) -> pd.DataFrame:
+    """
+    Full feature pipeline: the columns of sections 2-4 from one fused
+    kernel pass over the (game, time)-sorted arrays.
+
+    `raw` is not modified; the sort produces the only copy.  The
+    individual steps above instead mutate the frame they are given, so
+    call them on a frame you own.
+    """
+    df, codes = _sort_by_game_time(raw)
+    df = _alias_coords(df).pipe(_add_is_home)
+    loc_codes, neu_lut = _location_codes(df)
+
+    n = len(df)
+    zone = np.empty(n, dtype=np.int8)
+    entry = np.empty(n, dtype=np.int8)
+    mp = np.empty(n, dtype=np.int8)
+    xgd = np.empty(n, dtype=np.float64)
+    _featurize(
+        df["x"].to_numpy(),
+        df["isHomeTeam"].to_numpy(),
+        df["shotRush"].to_numpy(),
+        loc_codes,
+        neu_lut,
+        df["homeSkatersOnIce"].to_numpy(),
+        df["awaySkatersOnIce"].to_numpy(),
+        df["xGoal"].to_numpy(),
+        zone, entry, mp, xgd,
     )
+
+    df["offensive_zone"] = pd.Categorical.from_codes(zone, categories=OFFENSIVE_ZONES)
+    df["entry_type"] = pd.Categorical.from_codes(entry, categories=ENTRY_TYPES)
+    df["manpower_situation"] = pd.Categorical.from_codes(
+        mp, categories=MANPOWER_SITUATIONS
+    )
+    df["xGD_event"] = xgd
+    df["xGD_shift"] = _rolling_by_game(codes, xgd, window)
+    return df
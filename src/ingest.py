@@ -15,10 +15,14 @@ from __future__ import annotations
 import json
 import pathlib
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 
+import polars as pl
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
 # ---------------------------------------------------------------------#
 # Configuration constants
@@ -45,25 +49,148 @@ CANADIAN_TEAMS: Dict[str, int] = {
 
 NHL_API_ROOT = "https://api-web.nhle.com/v1/roster"
 
+# Narrow dtypes for the numeric model inputs, applied while *parsing* the
+# shots CSV (so no Float64/Int64 column is ever built) and kept in the
+# Parquet copy.  src/models.py reuses this for its CSV fallback.
+SHOT_DTYPES: Dict[str, pl.DataType] = {
+	"shotDistance": pl.Float32,
+	"shotAngleAdjusted": pl.Float32,
+	"period": pl.Int16,
+	"time": pl.Float32,
+}
+
+CHUNK_SIZE = 1 << 20  # 1 MiB per write while streaming
+MAX_WORKERS = 8       # concurrent roster requests (and pooled connections)
+
+# One session for every request → pooled keep-alive connections.
+# Transient 5xx / connection errors are retried with back-off; the final
+# response still goes through raise_for_status().
+SESSION = requests.Session()
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+SESSION.mount(
+	"https://",
+	HTTPAdapter(
+		pool_connections=MAX_WORKERS,
+		pool_maxsize=MAX_WORKERS,
+		max_retries=Retry(
+			total=3,
+			backoff_factor=0.5,
+			status_forcelist=(500, 502, 503, 504),
+			raise_on_status=False,
+		),
+	),
+)
+
+
+# ---------------------------------------------------------------------#
+# Conditional GET (ETag / Last-Modified sidecar)
+# ---------------------------------------------------------------------#
+def _meta_path(out_file: pathlib.Path) -> pathlib.Path:
+	"""Sidecar holding the validators of the response behind *out_file*."""
+	return out_file.with_name(out_file.name + ".meta.json")
+
+
+def _conditional_get(
+	url: str, out_file: pathlib.Path, **kwargs
+) -> requests.Response | None:
+	"""
+    GET *url*, revalidating against the cached *out_file* if there is one.
+    Returns ``None`` (and touches the file) when the server answers 304.
+    """
+	headers: Dict[str, str] = {}
+	meta_file = _meta_path(out_file)
+	if out_file.exists() and meta_file.exists():
+		meta = json.loads(meta_file.read_text())
+		if meta.get("etag"):
+			headers["If-None-Match"] = meta["etag"]
+		if meta.get("last_modified"):
+			headers["If-Modified-Since"] = meta["last_modified"]
+
+	resp = SESSION.get(url, headers=headers, **kwargs)
+	if resp.status_code == 304:
+		resp.close()
+		out_file.touch()
+		return None
+	resp.raise_for_status()
+	return resp
+
+
+def _save_meta(out_file: pathlib.Path, resp: requests.Response) -> None:
+	"""Persist the response validators next to *out_file*."""
+	meta = {
+		"etag": resp.headers.get("ETag"),
+		"last_modified": resp.headers.get("Last-Modified"),
+	}
+	_meta_path(out_file).write_text(json.dumps(meta, indent=2))
+
 
 # ---------------------------------------------------------------------#
 # MoneyPuck download
 # ---------------------------------------------------------------------#
+def _to_parquet(csv_file: pathlib.Path) -> pathlib.Path:
+	"""
+    Write a typed, Snappy-compressed Parquet copy of *csv_file* next to it
+    (same stem) so model runs skip CSV parsing.  Returns the Parquet path.
+
+    Like the CSV download, the data goes to a .part file that only gets the
+    real name once complete – models.main always prefers the Parquet copy,
+    so a truncated one must never appear under that name.
+    """
+	pq_file = csv_file.with_suffix(".parquet")
+	part_file = pq_file.with_name(pq_file.name + ".part")
+	pl.scan_csv(
+		csv_file, infer_schema_length=None, schema_overrides=SHOT_DTYPES
+	).sink_parquet(part_file, compression="snappy")
+	part_file.replace(pq_file)
+	print(f"Converted → {pq_file.name}")
+	return pq_file
+
+
+def _parquet_stale(csv_file: pathlib.Path) -> bool:
+	"""True if the Parquet copy is missing or older than *csv_file*."""
+	pq_file = csv_file.with_suffix(".parquet")
+	return (
+		not pq_file.exists()
+		or pq_file.stat().st_mtime < csv_file.stat().st_mtime
+	)
+
+
 def download_moneypuck(season: str = SEASON) -> pathlib.Path:
 	"""
     Download MoneyPuck shot-level CSV for *one* season.
-    Returns the local file path.
+    A cached copy is revalidated and only re-downloaded if it changed;
+    the Parquet copy is (re)built whenever the CSV is new, or the copy is
+    missing or older than the CSV.
+    Returns the local CSV path.
     """
 	out_file = DATA_DIR / f"shots_{season}.csv"
-	if out_file.exists():
-		print(f"[skip] {out_file.name} already present.")
-		return out_file
+	# decide before the request: a 304 touches the CSV
+	stale = out_file.exists() and _parquet_stale(out_file)
 
-	print(f"Downloading MoneyPuck shots for season {season} …")
-	resp = requests.get(MP_URL, timeout=60)
-	resp.raise_for_status()
+	print(f"Checking MoneyPuck shots for season {season} …")
+	resp = _conditional_get(MP_URL, out_file, stream=True, timeout=(5, 120))
+	if resp is None:
+		print(f"[skip] {out_file.name} is up to date.")
+		if stale:
+			_to_parquet(out_file)
+		else:
+			# keep the copy in step with the touched CSV
+			out_file.with_suffix(".parquet").touch()
+		return out_file
 
-	out_file.write_bytes(resp.content)
+	# Stream to a .part file; only a complete download gets the real name,
+	# so an interrupted run is retried instead of "skipped" next time.
+	part_file = out_file.with_name(out_file.name + ".part")
+	total = int(resp.headers.get("Content-Length", 0)) or None
+	with resp, part_file.open("wb") as fh, tqdm(
+		total=total, unit="B", unit_scale=True, desc=out_file.name
+	) as bar:
+		for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+			fh.write(chunk)
+			# Content-Length counts wire (gzip) bytes, not decoded ones
+			bar.update(resp.raw.tell() - bar.n)
+	part_file.replace(out_file)
+	_save_meta(out_file, resp)
 
 	# --- robust, cross-platform print ---
 	try:
@@ -72,41 +199,62 @@ def download_moneypuck(season: str = SEASON) -> pathlib.Path:
 		rel_path = out_file
 	print(f"Saved → {rel_path}")
 
+	_to_parquet(out_file)
 	return out_file
 
 
 # ---------------------------------------------------------------------#
 # NHL roster download
 # ---------------------------------------------------------------------#
+def _roster_url(team_code: str) -> str:
+	return f"{NHL_API_ROOT}/{team_code}/current"
+
+
+def _players(data: dict) -> List[dict]:
+	return data["forwards"] + data["defensemen"] + data["goalies"]
+
+
 def fetch_roster(team_code: str) -> List[dict]:
 	"""Return a list of player dictionaries for the given franchise code."""
-	url = f"{NHL_API_ROOT}/{team_code}/current"
-	resp = requests.get(url, timeout=30)
+	resp = SESSION.get(_roster_url(team_code), timeout=30)
 	resp.raise_for_status()
-	data = resp.json()
-	return data["forwards"] + data["defensemen"] + data["goalies"]
+	return _players(resp.json())
+
+
+def _download_roster(code: str) -> str | None:
+	"""Fetch + cache one roster; return a status line (None if unchanged)."""
+	out_file = DATA_DIR / f"roster_{code}.json"
+
+	try:
+		resp = _conditional_get(_roster_url(code), out_file, timeout=30)
+	except requests.HTTPError as exc:
+		return f"{code} roster failed: {exc}"
+	if resp is None:
+		return None
+
+	out_file.write_text(json.dumps(_players(resp.json()), indent=2))
+	_save_meta(out_file, resp)
+	return f"Saved roster → {out_file.name}"
 
 
 def download_rosters(team_codes: List[str] | None = None) -> None:
 	"""
     Download and cache rosters for all specified teams (defaults to the
-    seven Canadian clubs).  Skips any roster already on disk.
+    seven Canadian clubs).  Rosters already on disk are revalidated and
+    left alone if the API reports them unchanged.
+
+    Teams are fetched concurrently over the shared session.
     """
 	team_codes = team_codes or list(CANADIAN_TEAMS.keys())
 
-	for code in tqdm(team_codes, desc="Rosters"):
-		out_file = DATA_DIR / f"roster_{code}.json"
-		if out_file.exists():
-			continue
-
-		try:
-			roster = fetch_roster(code)
-		except requests.HTTPError as exc:
-			print(f"{code} roster failed: {exc}")
-			continue
-
-		out_file.write_text(json.dumps(roster, indent=2))
-		print(f"Saved roster → {out_file.name}")
+	with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+		for msg in tqdm(
+			pool.map(_download_roster, team_codes),
+			total=len(team_codes),
+			desc="Rosters",
+		):
+			if msg:
+				tqdm.write(msg)
 
 
 # ---------------------------------------------------------------------#
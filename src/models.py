@@ -14,30 +14,61 @@ from typing import Dict, Tuple
 import joblib
 import numpy as np
 import pandas as pd
+import polars as pl
+from lightgbm import LGBMRegressor
+from sklearn.base import clone
 from sklearn.compose import ColumnTransformer
-from sklearn.ensemble import (
-    ExtraTreesRegressor,
-    GradientBoostingRegressor,
-    HistGradientBoostingRegressor,
-    RandomForestRegressor,
-)
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.linear_model import ElasticNet
-from sklearn.metrics import make_scorer, r2_score
-from sklearn.model_selection import cross_val_score, train_test_split
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, train_test_split
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
 
-from features import build_feature_frame
+from features import (
+    ENTRY_TYPES,
+    MANPOWER_SITUATIONS,
+    OFFENSIVE_ZONES,
+    build_feature_frame,
+)
+from ingest import SHOT_DTYPES
 
 # ------------------------------------------------------------------ #
 # 0.  Paths & constants
 # ------------------------------------------------------------------ #
 DATA_CSV  = pathlib.Path("data/raw/shots_20232024.csv")
+DATA_PARQUET = DATA_CSV.with_suffix(".parquet")   # written by ingest
 MODEL_PKL = pathlib.Path("models/best_model.pkl")
 MODEL_PKL.parent.mkdir(parents=True, exist_ok=True)
 
+# on-disk cache of the fitted PREPROC_HIST, keyed on (transformer, fold
+# data); trimmed to PREP_CACHE_LIMIT after every model-selection run
+PREP_CACHE = joblib.Memory(".sk_cache", verbose=0)
+PREP_CACHE_LIMIT = "128M"
+
 CAT_FEATURES = ["entry_type", "manpower_situation", "offensive_zone"]
+CAT_CATEGORIES = [ENTRY_TYPES, MANPOWER_SITUATIONS, OFFENSIVE_ZONES]
 NUM_FEATURES = ["shotDistance", "shotAngleAdjusted", "period", "time"]
+# float32 / int16 – parsed that way from the CSV and stored that way in
+# the Parquet copy written by ingest
+NUM_DTYPES = {c: SHOT_DTYPES[c] for c in NUM_FEATURES}
+
+# raw MoneyPuck columns consumed by build_feature_frame + NUM_FEATURES
+RAW_COLUMNS = [
+    "team",
+    "arenaAdjustedXCord",
+    "arenaAdjustedYCord",
+    "shotRush",
+    "location",
+    "homeSkatersOnIce",
+    "awaySkatersOnIce",
+    "xGoal",
+    "game_id",
+    *NUM_FEATURES,
+]
+
+# the preprocessors emit CAT_FEATURES first → these column positions
+CAT_IDX = list(range(len(CAT_FEATURES)))
 
 CV_FOLDS = 5
 RANDOM_STATE = 73
@@ -47,19 +78,26 @@ RANDOM_STATE = 73
 # 1.  Candidate model factory
 # ------------------------------------------------------------------ #
 def get_models(random_state: int = RANDOM_STATE) -> Dict[str, object]:
-    """Return a dict of name → regressor instance."""
+    """
+    Return a dict of name → regressor instance.
+
+    Both boosters are histogram-based and split natively on the integer
+    category codes in columns CAT_IDX (LGBM gets them at fit time, see
+    fit_params).
+    """
     return {
         "HGBR": HistGradientBoostingRegressor(
-            learning_rate=0.05, max_depth=5, random_state=random_state
-        ),
-        "GBR": GradientBoostingRegressor(
-            learning_rate=0.05, max_depth=3, n_estimators=300, random_state=random_state
+            learning_rate=0.05,
+            max_depth=5,
+            categorical_features=CAT_IDX,
+            random_state=random_state,
         ),
-        "RF": RandomForestRegressor(
-            n_estimators=400, max_depth=None, n_jobs=-1, random_state=random_state
-        ),
-        "ET": ExtraTreesRegressor(
-            n_estimators=400, max_depth=None, n_jobs=-1, random_state=random_state
+        "LGBM": LGBMRegressor(
+            learning_rate=0.05,
+            n_estimators=300,
+            n_jobs=-1,
+            random_state=random_state,
+            verbose=-1,
         ),
         "ElasticNet": ElasticNet(
             alpha=0.001, l1_ratio=0.5, random_state=random_state, max_iter=2000
@@ -68,32 +106,133 @@ def get_models(random_state: int = RANDOM_STATE) -> Dict[str, object]:
 
 
 # ------------------------------------------------------------------ #
-# 2.  Preprocessor (shared across models)
+# 2.  Preprocessors
 # ------------------------------------------------------------------ #
-PREPROCESSOR = ColumnTransformer(
+# Fixed categories → fitting the encoders learns nothing from the fold.
+# Histogram boosters get ordinal codes (unknown → -1, treated as missing)
+# and split on them natively – no one-hot expansion.
+PREPROC_HIST = ColumnTransformer(
     [
-        ("cat", OneHotEncoder(handle_unknown="ignore"), CAT_FEATURES),
+        (
+            "cat",
+            OrdinalEncoder(
+                categories=CAT_CATEGORIES,
+                handle_unknown="use_encoded_value",
+                unknown_value=-1,
+                dtype=np.float32,
+            ),
+            CAT_FEATURES,
+        ),
         ("num", "passthrough", NUM_FEATURES),
     ]
 )
 
+# ElasticNet needs one-hot columns; ordinal codes would impose an order.
+# Binary features (offensive_zone) keep a single 0/1 column.
+PREPROC_LINEAR = ColumnTransformer(
+    [
+        (
+            "cat",
+            OneHotEncoder(
+                categories=CAT_CATEGORIES,
+                drop="if_binary",
+                handle_unknown="ignore",
+                sparse_output=True,
+                dtype=np.int8,
+            ),
+            CAT_FEATURES,
+        ),
+        ("num", "passthrough", NUM_FEATURES),
+    ]
+)
+
+
+def build_pipeline(model, memory: joblib.Memory | None = None) -> Pipeline:
+    """
+    Wrap *model* with the preprocessor that matches its input needs.
+
+    `memory` only applies to PREPROC_HIST – the one preprocessor several
+    candidates share; PREPROC_LINEAR has a single user, so caching it
+    would just write entries that are never read back.
+    """
+    if isinstance(model, ElasticNet):
+        return Pipeline([("prep", PREPROC_LINEAR), ("model", model)])
+    return Pipeline([("prep", PREPROC_HIST), ("model", model)], memory=memory)
+
+
+def fit_params(model) -> Dict[str, object]:
+    """
+    Extra `Pipeline.fit` kwargs for *model*.  LightGBM only honours
+    `categorical_feature` as a fit / Dataset argument, not a constructor one.
+    """
+    if isinstance(model, LGBMRegressor):
+        return {"model__categorical_feature": CAT_IDX}
+    return {}
+
 
 # ------------------------------------------------------------------ #
 # 3.  Model selection routine
 # ------------------------------------------------------------------ #
+def _fold_r2(
+    model, X: pd.DataFrame, y: pd.Series, train: np.ndarray, test: np.ndarray
+) -> float:
+    """
+    Fit a fresh pipeline on one CV split and return its hold-out R².
+
+    The pool already runs one job per core, so the estimator itself gets a
+    single thread (LightGBM would otherwise resolve n_jobs=-1 to every
+    core in each worker).
+    """
+    model = clone(model)
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=1)
+    pipe = build_pipeline(model, memory=PREP_CACHE)
+    pipe.fit(X.iloc[train], y.iloc[train], **fit_params(model))
+    return r2_score(y.iloc[test], pipe.predict(X.iloc[test]))
+
+
+def _warm_prep_cache(X: pd.DataFrame, y: pd.Series, folds: list) -> None:
+    """
+    Fit PREPROC_HIST once per fold in this process, before dispatch.
+
+    Without this the boosters' jobs for the same fold run concurrently in
+    different workers, both miss the cache, and both fit + write it.
+    """
+    warm = Pipeline(
+        [("prep", PREPROC_HIST), ("model", "passthrough")], memory=PREP_CACHE
+    )
+    for train, _ in folds:
+        warm.fit(X.iloc[train], y.iloc[train])
+
+
 def score_models(
     X: pd.DataFrame, y: pd.Series, models: Dict[str, object]
 ) -> Dict[str, Tuple[float, float]]:
-    """Return dict name → (mean_R2, std_R2) using CV_FOLDS cross-val."""
-    results: Dict[str, Tuple[float, float]] = {}
-    scorer = make_scorer(r2_score)
+    """
+    Return dict name → (mean_R2, std_R2) using CV_FOLDS cross-val.
+
+    Every (candidate, fold) pair is an independent job in one process
+    pool, so all cores stay busy regardless of how many candidates or
+    folds there are.  The shared PREPROC_HIST is fitted per fold up front
+    so every booster job reads it from PREP_CACHE.
+    """
+    folds = list(KFold(n_splits=CV_FOLDS).split(X))
+    _warm_prep_cache(X, y, folds)
+    jobs = [(name, train, test) for name in models for train, test in folds]
+
+    fold_scores = joblib.Parallel(n_jobs=-1, backend="loky")(
+        joblib.delayed(_fold_r2)(models[name], X, y, train, test)
+        for name, train, test in jobs
+    )
 
-    for name, model in models.items():
-        pipe = Pipeline([("prep", PREPROCESSOR), ("model", model)])
-        cv_scores = cross_val_score(pipe, X, y, cv=CV_FOLDS, scoring=scorer, n_jobs=-1)
+    results: Dict[str, Tuple[float, float]] = {}
+    for i, name in enumerate(models):
+        cv_scores = np.asarray(fold_scores[i * CV_FOLDS : (i + 1) * CV_FOLDS])
         results[name] = (cv_scores.mean(), cv_scores.std())
         print(f"{name:9s}: R² = {cv_scores.mean():.3f} ± {cv_scores.std():.3f}")
 
+    # entries are keyed on fold data → bound growth across data refreshes
+    PREP_CACHE.reduce_size(bytes_limit=PREP_CACHE_LIMIT)
     return results
 
 
@@ -101,8 +240,25 @@ def score_models(
 # 4.  Main
 # ------------------------------------------------------------------ #
 def main() -> None:
-    # Load & build feature frame
-    raw = pd.read_csv(DATA_CSV, low_memory=False)
+    # Load & build feature frame (lazy scan → only RAW_COLUMNS are read);
+    # prefer the Parquet copy, fall back to the CSV if ingest predates it.
+    # The CSV schema is inferred from every row: MoneyPuck columns can look
+    # integer for the first rows and turn decimal later (as in _to_parquet).
+    scan = (
+        pl.scan_parquet(DATA_PARQUET)
+        if DATA_PARQUET.exists()
+        else pl.scan_csv(
+            DATA_CSV, infer_schema_length=None, schema_overrides=NUM_DTYPES
+        )
+    )
+    raw = (
+        scan.select(RAW_COLUMNS)
+        # no-op for either source above; only narrows a Parquet copy that
+        # was written before ingest applied SHOT_DTYPES
+        .with_columns([pl.col(c).cast(t) for c, t in NUM_DTYPES.items()])
+        .collect()
+        .to_pandas()
+    )
     df = build_feature_frame(raw)
 
     X = df[CAT_FEATURES + NUM_FEATURES]
@@ -118,11 +274,11 @@ def main() -> None:
     print(f"\n🏆  Best model: {best_name} (mean CV R² = {scores[best_name][0]:.3f})")
 
     # Retrain best model on **full** data  (with train/test split for a report)
-    pipe = Pipeline([("prep", PREPROCESSOR), ("model", best_model)])
+    pipe = build_pipeline(best_model)
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.20, random_state=RANDOM_STATE
     )
-    pipe.fit(X_train, y_train)
+    pipe.fit(X_train, y_train, **fit_params(best_model))
     holdout_r2 = pipe.score(X_test, y_test)
     print(f"Hold-out R² (20 % split) : {holdout_r2:.3f}")
 
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from src.features import _rolling_by_game
+
+
+def test_rolling_by_game_skips_nan_like_pandas():
+    x = np.array([0.1, -0.1, np.nan, -0.1, 0.2, np.nan, np.nan, np.nan, 0.3,
+                  0.1, -0.2, 0.05])
+    codes = np.zeros(len(x), dtype=np.int64)
+    codes[8:] = 1                                   # second game
+
+    expected = (
+        pd.Series(x)
+        .groupby(codes)
+        .rolling(3, min_periods=1)
+        .sum()
+        .to_numpy()
+    )
+    got = _rolling_by_game(codes, x, window=3)
+
+    # the all-NaN window (rows 5-7) stays NaN; later rows recover
+    np.testing.assert_allclose(got, expected, equal_nan=True)
+    assert np.isnan(got[7]) and not np.isnan(got[3])
+
+
+def test_sort_by_game_time_keeps_fractional_and_nan_order():
+    from src.features import _sort_by_game_time
+
+    df = pd.DataFrame(
+        {
+            "game_id": [2, 1, 1, 1, np.nan],
+            "time": [1.0, 5.9, np.nan, 5.2, 0.0],
+        }
+    )
+    out, codes = _sort_by_game_time(df)
+
+    assert out.index.tolist() == [4, 3, 1, 2, 0]
+    assert codes.tolist() == [-1, 0, 0, 0, 1]
+    assert np.isnan(_rolling_by_game(codes, np.ones(5), 3)[0])
+
+
+def test_manpower_step_needs_only_its_own_columns():
+    from src.features import add_manpower_situation
+
+    df = pd.DataFrame(
+        {
+            "isHomeTeam": [True, False, True, False],
+            "homeSkatersOnIce": [5, 5, 4, 5],
+            "awaySkatersOnIce": [4, 4, 5, 3],
+        }
+    )
+    out = add_manpower_situation(df)
+
+    assert out["manpower_situation"].tolist() == ["PP", "SH", "SH", "OTHER"]